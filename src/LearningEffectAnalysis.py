@@ -23,30 +23,56 @@ The application performs the following key operations:
 # =============================================================================
 # SECTION 1: DEPENDENCY MANAGEMENT
 # =============================================================================
-import importlib
-import subprocess
+import importlib.util
 import sys
 import tkinter
 import re
 
+# Dependencies are installed from requirements.txt; fail fast with one clear message
+# instead of a traceback from whichever import happens to break first.
+REQUIRED_PACKAGES = ['customtkinter', 'pandas', 'numpy', 'scipy', 'xlsxwriter', 'openpyxl']
+_missing_packages = [pkg for pkg in REQUIRED_PACKAGES
+                     if pkg not in sys.modules and importlib.util.find_spec(pkg) is None]
+if _missing_packages:
+    sys.exit(f"Missing required packages: {', '.join(_missing_packages)}\n"
+             f"Install them with: pip install -r requirements.txt")
+
 # =============================================================================
 # SECTION 2: IMPORTS
 # =============================================================================
+import math
+import os
+import queue
 import threading
+import hashlib
+import pickle
+import shutil
+from array import array
+from collections import namedtuple
+import multiprocessing
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from pathlib import Path
 import configparser
+import csv
 import traceback
+import types
 
 import customtkinter as ctk
+import openpyxl
 import pandas as pd
 import numpy as np
-from scipy.stats import shapiro, ttest_rel, wilcoxon
+import xlsxwriter
 from tkinter import filedialog, messagebox
+# scipy.stats and the optional numba are imported where the statistics run (see 4.4):
+# participant worker processes import this module too, and need neither.
 
 # =============================================================================
 # SECTION 3: CONFIGURATION HELPERS
 # =============================================================================
 CONFIG_PATH = Path.home() / ".trial_analyzer_config.ini"
+CACHE_DIR = Path.home() / ".trial_analyzer_cache"
 
 
 def load_default_paths() -> dict:
@@ -87,70 +113,471 @@ def save_default_paths(data_path: str, timeline_path: str):
 
 # ---[ 4.1 General Helper Functions ]---
 
+# Shared pool for loading a participant's trial files concurrently in the analysis's
+# own process. Only file reads and zlib inflation release the GIL; openpyxl's XML-to-cell
+# work holds it, so threads give a partial overlap (about 20% on a single core). Inside a
+# participant worker process files are loaded serially instead: the process pool already
+# occupies the cores, and threads on top would only oversubscribe them.
+_FILE_POOL = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+
+
+def _map_files(func, items) -> list:
+    """Applies `func` to each item, on _FILE_POOL unless running in a participant worker process."""
+    if multiprocessing.parent_process() is not None:
+        return list(map(func, items))
+    return list(_FILE_POOL.map(func, items))
+
+
+# Matches the number at the end of the filename, right before the extension.
+_TRIAL_NUM_RE = re.compile(r'(\d+)\.(?:xls|csv)', re.IGNORECASE)
+
+
 def extract_trial_number(path: Path) -> int:
     """Extracts the numerical index from a trial filename."""
-    # Uses regex to find the number at the end of the filename, before the extension.
-    match = re.search(r'(\d+)\.xls', path.name, re.IGNORECASE)
+    name = path.name
+    lower = name.lower()
+    ext_pos = min((pos for pos in (lower.find('.xls'), lower.find('.csv')) if pos != -1), default=-1)
+    if ext_pos == -1:
+        return -1
+    if ext_pos == name.rfind('.'):
+        # Common case: '.xls*'/'.csv' is the only extension, so walk back over the digits
+        # before it instead of running the regex.
+        start = ext_pos
+        while start > 0 and name[start - 1].isdecimal():
+            start -= 1
+        return int(name[start:ext_pos]) if start < ext_pos else -1
+    match = _TRIAL_NUM_RE.search(name)
     return int(match.group(1)) if match else -1
 
 
-def load_series_from_file(file_path: Path) -> pd.Series:
-    """Loads a single trial's data from a direct file path into a pandas Series."""
-    df = pd.read_excel(file_path).rename(columns=str.strip)
-    if 'Variable' not in df.columns or 'Value' not in df.columns:
+def extract_trial_numbers(paths) -> np.ndarray:
+    """Extracts the trial numbers of many filenames at once, as an int64 array (-1 where there is none)."""
+    return np.fromiter(map(extract_trial_number, paths), dtype=np.int64, count=len(paths))
+
+
+def _numbered_files(paths) -> tuple:
+    """Returns (trial_numbers, paths) for the files whose names carry a trial number."""
+    nums = extract_trial_numbers(paths)
+    keep = np.flatnonzero(nums != -1)
+    return nums[keep], [paths[i] for i in keep]
+
+
+def _is_data_entry(entry: os.DirEntry) -> bool:
+    """
+    True for a visible file matching '*.xls*' or '*.csv'; hidden ones (e.g. macOS '._'
+    files) are skipped.
+    """
+    name = os.path.normcase(entry.name)
+    return (not name.startswith('.') and ('.xls' in name or name.endswith('.csv'))
+            and entry.is_file())
+
+
+def _subdirs(path) -> list:
+    """
+    Lists the visible subdirectories of `path` as os.DirEntry objects, using the type info
+    from the directory read; hidden ones (e.g. '.git') are skipped like hidden files.
+    """
+    with os.scandir(path) as it:
+        return [entry for entry in it if not entry.name.startswith('.') and entry.is_dir()]
+
+
+@lru_cache(maxsize=1024)
+def _list_data_files_cached(dir_str: str, mtime_ns: int) -> tuple:
+    with os.scandir(dir_str) as it:
+        return tuple(Path(entry.path) for entry in it if _is_data_entry(entry))
+
+
+def list_data_files(directory: Path) -> tuple:
+    """
+    Lists the Excel and CSV data files in a directory.
+    Listings are memoized until the directory's modification time changes (i.e.
+    entries are added, removed or renamed), so repeated lookups skip the rescan.
+    """
+    return _list_data_files_cached(str(directory), directory.stat().st_mtime_ns)
+
+
+def _pad_rows(rows):
+    """Skips blank rows and pads the others with None to the first (header) row's width."""
+    width = None
+    for row in rows:
+        if not any(cell is not None for cell in row):
+            continue
+        if width is None:
+            width = len(row)
+        yield row + (None,) * (width - len(row))
+
+
+def _iter_sheet_rows(file_path: Path):
+    """
+    Lazily yields the rows (header first) of a CSV file or an Excel file's first worksheet
+    as tuples, skipping blank rows. Every row is at least as wide as the header.
+    """
+    wb = None
+    if file_path.suffix.lower() in ('.xlsx', '.xlsm'):
         try:
-            vcol = next(c for c in df.columns if 'var' in c.lower())
-            ycol = next(c for c in df.columns if 'val' in c.lower())
-            df = df.rename(columns={vcol: 'Variable', ycol: 'Value'})
-        except StopIteration:
-            raise ValueError(f"Could not find 'Variable'/'Value' columns in {file_path}")
-    return pd.Series(df.Value.values, index=df.Variable.values)
+            wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        except Exception:
+            pass  # Not a workbook openpyxl can read (e.g. a legacy file renamed to .xlsx); use pandas.
+    if wb is not None:
+        # Stream the sheet with openpyxl directly; read-only mode skips building the
+        # full cell model and pandas' DataFrame construction/dtype inference.
+        try:
+            # Read-only worksheets often report trailing empty rows, and when a writer omits the
+            # sheet's <dimension> element, each row ends at its last non-blank cell.
+            yield from _pad_rows(wb.active.iter_rows(values_only=True))
+        finally:
+            wb.close()
+    elif file_path.suffix.lower() == '.csv':
+        # The tables are a few short text rows; the csv module reads them without
+        # pandas' parser setup and DataFrame construction. Empty fields become None,
+        # like blank cells.
+        with open(file_path, newline='', encoding='utf-8-sig') as f:
+            yield from _pad_rows(tuple(cell if cell.strip() else None for cell in row) for row in csv.reader(f))
+    else:
+        # pandas sniffs the real format and picks the engine (e.g. xlrd for legacy .xls).
+        df = pd.read_excel(file_path, header=None).dropna(how='all')
+        yield from df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+def _parse_trial_file(file_path: Path) -> tuple:
+    """Parses a trial file's 'Variable'/'Value' columns into a (variables tuple, float64 values array) pair."""
+    rows = _iter_sheet_rows(file_path)
+    header = [str(c).strip() if c is not None else '' for c in next(rows, ())]
+    try:
+        if 'Variable' in header and 'Value' in header:
+            vcol, ycol = header.index('Variable'), header.index('Value')
+        else:
+            vcol = next(i for i, c in enumerate(header) if 'var' in c.lower())
+            ycol = next(i for i, c in enumerate(header) if 'val' in c.lower())
+    except StopIteration:
+        rows.close()
+        raise ValueError(f"Could not find 'Variable'/'Value' columns in {file_path}")
+
+    # Collect both columns in a single pass over the streamed rows; values go
+    # straight into a typed double buffer instead of a list of Python objects.
+    variables, values = [], array('d')
+    try:
+        for row in rows:
+            variables.append(row[vcol])
+            value = row[ycol]
+            try:
+                values.append(math.nan if value is None else value)
+            except TypeError:
+                values.append(float(value))  # numeric text such as '1.5'
+    except (TypeError, ValueError):
+        rows.close()
+        raise ValueError(f"Non-numeric 'Value' entries in {file_path}")
+    return tuple(variables), np.asarray(values, dtype=np.float64)
+
+
+# Bump whenever the parsing rules or the pickled format change: entries live in a folder
+# per version, and _prune_disk_cache() deletes the other versions' folders.
+_CACHE_VERSION = 2
+# Above this total size, _prune_disk_cache() deletes the oldest entries, which also drops
+# the entries of files that were deleted or moved.
+_MAX_CACHE_BYTES = 256 * 2 ** 20
+
+
+def _disk_cached(file_path: Path, kind: str, parse):
+    """
+    Returns parse(file_path), persisted as a pickle in CACHE_DIR so later runs can skip
+    re-parsing. Each file has one entry, stamped with the file's modification time and
+    size; an edited file misses the cache and its entry is overwritten. Cache errors never
+    fail the analysis.
+    """
+    stat = file_path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    key = f"{kind}:{file_path.resolve()}"
+    cache_dir = CACHE_DIR / f"v{_CACHE_VERSION}"
+    cache_path = cache_dir / f"{hashlib.blake2b(key.encode(), digest_size=20).hexdigest()}.pkl"
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_stamp, result = pickle.load(f)
+        if cached_stamp == stamp:
+            return result
+    except Exception:
+        pass  # Missing or unreadable cache entry; fall through and re-parse.
+
+    result = parse(file_path)
+    # Write to a private temp file and rename it into place, so a concurrent reader
+    # (another worker or app instance) never sees a half-written entry.
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((stamp, result), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)  # Caching is best-effort (e.g. read-only home directory).
+    return result
+
+
+def _prune_disk_cache():
+    """
+    Deletes disk cache entries of other cache versions, then the oldest entries of this
+    version until the rest fit in _MAX_CACHE_BYTES. Errors are ignored, as for the cache itself.
+    """
+    version_dir = CACHE_DIR / f"v{_CACHE_VERSION}"
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            stale = [entry for entry in it if entry.name != version_dir.name]
+        for entry in stale:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.unlink(entry.path)
+        with os.scandir(version_dir) as it:
+            entries = sorted((entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                             for entry in it if entry.name.endswith('.pkl'))
+    except OSError:
+        return
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= _MAX_CACHE_BYTES:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+
+
+# Trial files of one experiment share a handful of variable layouts; keeping one tuple
+# per layout lets callers check that two trials line up with an identity test. The
+# table is reset past _MAX_VARIABLE_LAYOUTS entries; older layouts then merely miss
+# the identity fast path in _first_last_means.
+_VARIABLE_LAYOUTS = {}
+_MAX_VARIABLE_LAYOUTS = 1024
+
+
+@lru_cache(maxsize=4096)
+def _load_trial_cached(path_str: str, mtime_ns: int, size: int) -> tuple:
+    """Loads a trial file, memoized in memory per (path, mtime, size) on top of the disk cache."""
+    variables, values = _disk_cached(Path(path_str), 'trial', _parse_trial_file)
+    values.flags.writeable = False  # shared by every caller of the cache
+    if len(_VARIABLE_LAYOUTS) >= _MAX_VARIABLE_LAYOUTS:
+        _VARIABLE_LAYOUTS.clear()
+    return _VARIABLE_LAYOUTS.setdefault(variables, variables), values
+
+
+@lru_cache(maxsize=4096)
+def _load_series_cached(path_str: str, mtime_ns: int, size: int) -> pd.Series:
+    variables, values = _load_trial_cached(path_str, mtime_ns, size)
+    return pd.Series(values, index=np.asarray(variables, dtype=object))
+
+
+def clear_cache():
+    """Deletes the on-disk parse cache and empties the in-memory caches, including the workers'."""
+    _shutdown_process_pool()
+    for cached in (_load_trial_cached, _load_series_cached, _load_timeline_cached, _list_data_files_cached,
+                   _name_prefix_index_cached, _build_timeline_index_cached):
+        cached.cache_clear()
+    _VARIABLE_LAYOUTS.clear()
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+
+def load_trial_from_file(file_path: Path) -> tuple:
+    """
+    Loads a single trial's data from a direct file path as a (variables tuple, values array)
+    pair. Results are memoized per (path, modification time, size), as in the disk cache;
+    the values array is read-only.
+    """
+    stat = file_path.stat()
+    return _load_trial_cached(str(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+def load_series_from_file(file_path: Path) -> pd.Series:
+    """
+    Loads a single trial's data from a direct file path into a pandas Series.
+    Results are memoized per (path, modification time, size); treat the returned Series as read-only.
+    """
+    stat = file_path.stat()
+    return _load_series_cached(str(file_path), stat.st_mtime_ns, stat.st_size)
+
+
+def _stack_block(trials: list, index: pd.Index) -> np.ndarray:
+    """Stacks (variables, values) trials into a (variables x trials) float array aligned to `index`."""
+    series_list = (pd.Series(values, index=np.asarray(variables, dtype=object)) for variables, values in trials)
+    return np.stack(
+        [(s if s.index.equals(index) else s.reindex(index)).to_numpy(dtype=np.float64) for s in series_list],
+        axis=1,
+    )
+
+
+def _nanmean(arr: np.ndarray, axis: int) -> np.ndarray:
+    """Means ignoring NaN (matching pandas' skipna), without warnings for all-NaN slices."""
+    counts = np.count_nonzero(~np.isnan(arr), axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nansum(arr, axis=axis) / counts
+
+
+# One variable's (first block mean, last block mean); compares equal to a plain tuple.
+VarStat = namedtuple('VarStat', 'first last')
+
+
+class MeansResult(namedtuple('MeansResult', 'variables first last')):
+    """
+    A participant's block means: `variables` is a tuple of names and `first`/`last` are
+    float arrays aligned with it. Of the old {variable: (first, last)} dict's interface,
+    `[name]`, `name in`, keys() and items() are kept; len() and iteration are the tuple's
+    (three fields), so use as_dict() for anything else.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                i = self.variables.index(key)
+            except ValueError:
+                # A dict lookup's error: run_analysis reads ValueError as "skip this participant".
+                raise KeyError(key) from None
+            return VarStat(self.first[i], self.last[i])
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        return key in self.variables
+
+    def keys(self) -> tuple:
+        """Returns the variable names, like dict.keys()."""
+        return self.variables
+
+    def items(self):
+        """Yields (variable, VarStat(first mean, last mean)) pairs, like dict.items()."""
+        return zip(self.variables, map(VarStat, self.first, self.last))
+
+    def as_dict(self) -> dict:
+        """Returns the means as {variable: VarStat(first mean, last mean)}."""
+        return dict(self.items())
+
+
+def _first_last_means(first_trials: list, last_trials: list) -> MeansResult:
+    """
+    Computes each variable's first block and last block mean, given the blocks'
+    (variables, values) trials. When every trial has the same variable layout (the usual
+    case) the values are stacked as they are; otherwise they are aligned on the variables
+    seen in the first block.
+    """
+    variables = first_trials[0][0]
+    if all(v is variables for v, _ in first_trials) and all(v is variables for v, _ in last_trials):
+        m1 = _nanmean(np.stack([values for _, values in first_trials]), axis=0)
+        m2 = _nanmean(np.stack([values for _, values in last_trials]), axis=0)
+        return MeansResult(variables, m1, m2)
+
+    index = pd.Index(np.asarray(variables, dtype=object))
+    for v, _ in first_trials[1:]:
+        if v is not variables:
+            index = index.append(pd.Index(np.asarray(v, dtype=object)).difference(index, sort=False))
+    m1 = _nanmean(_stack_block(first_trials, index), axis=1)
+    m2 = _nanmean(_stack_block(last_trials, index), axis=1)
+    return MeansResult(tuple(index), m1, m2)
 
 
 # ---[ 4.2 Timeline-based Analysis Functions ]---
 
-def find_timeline_file(part_dir: Path, timeline_dir: Path, condition: str) -> Path:
-    """Finds the correct timeline file for a specific participant and condition."""
-    participant_id = part_dir.name.lower()
-    condition_lower = condition.lower()
-    found_files = []
-    if timeline_dir.is_dir():
-        for f in timeline_dir.glob('*.xls*'):
-            fname_lower = f.name.lower()
-            if (fname_lower.startswith(participant_id + "_") and
-                    f"_{condition_lower}_" in fname_lower and
-                    "timeline" in fname_lower):
-                found_files.append(f)
-    if not found_files:
+@lru_cache(maxsize=64)
+def _build_timeline_index_cached(dir_str: str, mtime_ns: int) -> dict:
+    index = {}
+    for f in list_data_files(Path(dir_str)):
+        fname_lower = f.name.lower()
+        if "timeline" not in fname_lower:
+            continue
+        parts = fname_lower.split("_")
+        conditions = parts[1:-1]  # names enclosed by underscores on both sides
+        for i in range(1, len(parts)):
+            participant_id = "_".join(parts[:i])
+            for condition_lower in conditions:
+                index.setdefault((participant_id, condition_lower), f)
+    return index
+
+
+def build_timeline_index(timeline_dir: Path) -> dict:
+    """
+    Indexes a timeline folder by (participant_id, condition), both lowercase.
+    A file named '<participant>_..._<condition>_...' containing 'timeline' is listed
+    under every such pair; when several files match a pair, the first one listed wins.
+    The index is memoized until the folder changes; treat it as read-only.
+    """
+    if not timeline_dir.is_dir():
+        return {}
+    return _build_timeline_index_cached(str(timeline_dir), timeline_dir.stat().st_mtime_ns)
+
+
+def find_timeline_file(part_dir: Path, timeline_dir: Path, condition: str, timeline_index: dict = None) -> Path:
+    """
+    Finds the correct timeline file for a specific participant and condition.
+    Pass a prebuilt `timeline_index` (see build_timeline_index) to avoid rescanning the folder.
+    """
+    if timeline_index is None:
+        timeline_index = build_timeline_index(timeline_dir)
+    found_file = timeline_index.get((part_dir.name.lower(), condition.lower()))
+    if found_file is None:
         raise FileNotFoundError(f"No timeline file for P '{part_dir.name}'/Cond '{condition}' in {timeline_dir}")
-    return found_files[0]
+    return found_file
 
 
-def load_timeline(part_dir: Path, timeline_dir: Path, condition: str) -> list:
-    """Loads a timeline file and returns a clean list of trial event IDs."""
-    timeline_file_path = find_timeline_file(part_dir, timeline_dir, condition)
-    df = pd.read_excel(timeline_file_path)
+def _parse_timeline_file(timeline_file_path: Path) -> list:
+    """Parses a timeline file's 'type'/'trial' columns into trial event IDs."""
+    rows = _iter_sheet_rows(timeline_file_path)
+    header = [str(c).lower() if c is not None else '' for c in next(rows, ())]
     try:
-        type_col = next(c for c in df.columns if "type" in c.lower())
-        index_col = next(c for c in df.columns if "trial" in c.lower())
+        type_col = next(i for i, c in enumerate(header) if "type" in c)
+        index_col = next(i for i, c in enumerate(header) if "trial" in c)
     except StopIteration:
+        rows.close()
         raise ValueError("Could not find 'type' and 'trial' columns in timeline file.")
-    events = df[type_col].astype(str).str.strip().str.lower().tolist()
-    idxs = df[index_col].astype(str).str.strip().tolist()
-    return [f"{ev}{ix}" for ev, ix in zip(events, idxs)]
+    # Single streaming pass over the sheet, building each event ID directly.
+    return [f"{str(row[type_col]).strip().lower()}{str(row[index_col]).strip()}" for row in rows]
+
+
+@lru_cache(maxsize=256)
+def _load_timeline_cached(path_str: str, mtime_ns: int, size: int) -> tuple:
+    """Loads a timeline file, memoized in memory per (path, mtime, size) on top of the disk cache."""
+    return tuple(_disk_cached(Path(path_str), 'timeline', _parse_timeline_file))
+
+
+def load_timeline(part_dir: Path, timeline_dir: Path, condition: str, timeline_index: dict = None) -> list:
+    """Loads a timeline file and returns a clean list of trial event IDs."""
+    timeline_file_path = find_timeline_file(part_dir, timeline_dir, condition, timeline_index)
+    stat = timeline_file_path.stat()
+    return list(_load_timeline_cached(str(timeline_file_path), stat.st_mtime_ns, stat.st_size))
+
+
+# A timeline trial ID is the outcome word followed by the trial number, e.g. 'loss12'.
+_TRIAL_ID_RE = re.compile(r'([A-Za-z]+)(\d+)')
+
 
+@lru_cache(maxsize=1024)
+def _name_prefix_index_cached(dir_str: str, mtime_ns: int) -> dict:
+    index = {}
+    for pos, f in enumerate(list_data_files(Path(dir_str))):
+        name = f.name.lower()
+        dot = name.find('.')
+        while dot != -1:
+            index.setdefault(name[:dot + 1], (pos, f))
+            dot = name.find('.', dot + 1)
+    return index
 
-def load_trial_series_from_id(part_dir: Path, condition: str, trial_id: str) -> pd.Series:
+
+def _name_prefix_index(directory: Path) -> dict:
+    """
+    Maps every lowercase filename prefix ending in a '.' (e.g. 'p11_serve_loss1.') to the
+    (listing position, path) of the first data file in the directory that starts with it.
+    Memoized per (directory, mtime), like list_data_files.
+    """
+    return _name_prefix_index_cached(str(directory), directory.stat().st_mtime_ns)
+
+
+def load_trial_from_id(part_dir: Path, condition: str, trial_id: str) -> tuple:
     """
     Loads a single trial's data based on a constructed trial ID (for Timeline mode).
     This function is flexible to different file naming schemes (e.g., 'P1_Serve_loss1' vs 'P1_Serve_l1')
     and searches for the file within the appropriate 'win' or 'loss' subfolder.
     """
-    # 1. Extract outcome string (e.g., 'loss') and number (e.g., '1') from the trial_id
-    outcome_str = ''.join(filter(str.isalpha, trial_id))
-    number_str = ''.join(filter(str.isdigit, trial_id))
-    if not outcome_str or not number_str:
+    # 1. Split the trial_id into its outcome string (e.g., 'loss') and number (e.g., '1')
+    match = _TRIAL_ID_RE.fullmatch(trial_id)
+    if not match:
         raise ValueError(f"Invalid trial_id format from timeline: '{trial_id}'")
+    outcome_str, number_str = match.groups()
 
     # 2. Define the search directory based on the outcome (e.g., .../P11/loss/)
     search_dir = part_dir / outcome_str
@@ -164,147 +591,469 @@ def load_trial_series_from_id(part_dir: Path, condition: str, trial_id: str) ->
     pattern_full = f"{base_name}{outcome_str}{number_str}."  # e.g., 'P11_Serve_loss1.'
     pattern_abbr = f"{base_name}{outcome_str[0]}{number_str}."  # e.g., 'P11_Serve_l1.'
 
-    # 5. Search for a file matching either pattern, case-insensitively
-    found_file = None
-    for f in search_dir.glob('*.xls*'):
-        fname_lower = f.name.lower()
-        if fname_lower.startswith(pattern_full.lower()) or fname_lower.startswith(pattern_abbr.lower()):
-            found_file = f
-            break  # Found a match, stop looking
-
-    if not found_file:
+    # 5. Look up a file matching either pattern, case-insensitively; if both match,
+    #    the one listed first wins, as with a linear scan
+    index = _name_prefix_index(search_dir)
+    hits = [index[p.lower()] for p in (pattern_full, pattern_abbr) if p.lower() in index]
+    if not hits:
         raise FileNotFoundError(f"No file matching '{pattern_full}' or '{pattern_abbr}' found in {search_dir}")
 
-    return load_series_from_file(found_file)
+    return load_trial_from_file(min(hits)[1])
 
 
-def gather_means_timeline(part_dir: Path, timeline_dir: Path, condition: str, n: int) -> dict:
+def gather_means_timeline(part_dir: Path, timeline_dir: Path, condition: str, n: int,
+                          timeline_index: dict = None) -> MeansResult:
     """Calculates means for the first/last N trials based on a timeline."""
-    timeline = load_timeline(part_dir, timeline_dir, condition)
+    timeline = load_timeline(part_dir, timeline_dir, condition, timeline_index)
     if len(timeline) < 2 * n:
         raise ValueError(f"{part_dir.name} has only {len(timeline)} events (need at least {2 * n})")
     first_ids = timeline[:n]
     last_ids = timeline[-n:]
-    first_df = pd.concat([load_trial_series_from_id(part_dir, condition, tid) for tid in first_ids], axis=1)
-    last_df = pd.concat([load_trial_series_from_id(part_dir, condition, tid) for tid in last_ids], axis=1)
-    return {var: (first_df.loc[var].mean(), last_df.loc[var].mean()) for var in first_df.index}
+    def load(tid):
+        return load_trial_from_id(part_dir, condition, tid)
+
+    return _first_last_means(_map_files(load, first_ids), _map_files(load, last_ids))
 
 
 # ---[ 4.3 Outcome-based Analysis Functions ]---
 
-def gather_means_outcome(part_dir: Path, condition: str, outcome: str, n: int) -> dict:
+def _scan_outcome_dir(outcome_dir: Path):
+    """
+    Lists an outcome folder's data files that carry a trial number as (trial_numbers, paths)
+    (see _numbered_files) with a single os.scandir pass, or returns None if the folder does
+    not exist. Other OSErrors (e.g. permission denied) propagate.
+    """
+    try:
+        with os.scandir(outcome_dir) as it:
+            paths = [Path(entry.path) for entry in it if _is_data_entry(entry)]
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return _numbered_files(paths)
+
+
+def _first_last_files(nums: np.ndarray, paths: list, n: int) -> tuple:
+    """
+    Returns the paths of the n earliest and n latest trials, each in chronological order.
+    Only 2n of the files are needed, so np.partition finds the cut-off trial numbers in
+    linear time and just the files on the right side of each cut-off are sorted; equal
+    trial numbers are ordered by path, as a full sort would.
+    """
+    m = len(nums)
+    first_cut = np.partition(nums, n - 1)[n - 1]
+    last_cut = np.partition(nums, m - n)[m - n]
+    first = sorted((int(nums[i]), paths[i]) for i in np.flatnonzero(nums <= first_cut))[:n]
+    last = sorted((int(nums[i]), paths[i]) for i in np.flatnonzero(nums >= last_cut))[-n:]
+    return [f for _, f in first], [f for _, f in last]
+
+
+def gather_means_outcome(part_dir: Path, condition: str, outcome: str, n: int,
+                         trial_files: tuple = None) -> MeansResult:
     """
     Calculates means for the first/last N trials of a specific outcome.
     This function searches for trial files within a subfolder corresponding to the
-    outcome (e.g., 'win' or 'loss') inside the participant's directory.
+    outcome (e.g., 'win' or 'loss') inside the participant's directory, unless the
+    (trial_numbers, paths) listing is passed in as `trial_files` (see _scan_outcome_dir).
     """
     # Define the search directory based on the outcome (e.g., .../P1/win/)
     outcome_dir = part_dir / outcome.lower()
-    if not outcome_dir.is_dir():
-        raise FileNotFoundError(f"Outcome folder '{outcome.lower()}' not found for participant {part_dir.name}")
-
-    # Find all Excel files in the outcome directory that have a number in their name.
-    all_files = [f for f in outcome_dir.glob('*.xls*') if extract_trial_number(f) != -1]
+    if trial_files is not None:
+        nums, paths = trial_files
+    else:
+        if not outcome_dir.is_dir():
+            raise FileNotFoundError(f"Outcome folder '{outcome.lower()}' not found for participant {part_dir.name}")
 
-    # Sort the collected files chronologically based on the extracted trial number.
-    files = sorted(all_files, key=extract_trial_number)
+        # Keep every data file that has a number in its name, with that trial number (one parse per file).
+        nums, paths = _numbered_files(list_data_files(outcome_dir))
 
-    if not files:
+    if not paths:
         raise FileNotFoundError(f"No valid trial files found in '{outcome_dir}'")
 
-    if len(files) < 2 * n:
-        raise ValueError(f"{part_dir.name} has only {len(files)} '{outcome}' files (need at least {2 * n})")
+    if len(paths) < 2 * n:
+        raise ValueError(f"{part_dir.name} has only {len(paths)} '{outcome}' files (need at least {2 * n})")
 
-    first_files = files[:n]
-    last_files = files[-n:]
+    first_files, last_files = _first_last_files(nums, paths, n)
 
-    first_df = pd.concat([load_series_from_file(f) for f in first_files], axis=1)
-    last_df = pd.concat([load_series_from_file(f) for f in last_files], axis=1)
-    return {var: (first_df.loc[var].mean(), last_df.loc[var].mean()) for var in first_df.index}
+    return _first_last_means(
+        _map_files(load_trial_from_file, first_files),
+        _map_files(load_trial_from_file, last_files),
+    )
 
 
 # ---[ 4.4 Main Analysis Runners ]---
 
+RESULT_COLUMNS = ['Condition', 'Variable', 'N', 'Mean_First', 'Mean_Last',
+                  'Shapiro_p', 'Test', 'Test_stat', 'p_value']
+
+def _participant_worker(part_dir: Path, mode: str, condition: str, timeline_dir: Path,
+                        timeline_index: dict, outcome: str, trial_files: tuple, n: int) -> MeansResult:
+    """
+    Computes one participant's first/last means for a condition.
+    Kept at module level with plain arguments so it pickles cheaply into a worker process.
+    """
+    # ROUTER: Call the correct 'gather_means' function based on mode
+    if mode == 'timeline':
+        return gather_means_timeline(part_dir, timeline_dir, condition, n, timeline_index)
+    else:  # mode == 'outcome'
+        return gather_means_outcome(part_dir, condition, outcome, n, trial_files)
+
+
+# SciPy's default Wilcoxon method is exact up to this many pairs and uses the
+# normal approximation (no continuity correction) above it.
+_WILCOXON_EXACT_MAX_N = 50
+
+# The kernel's column loop runs on range in plain Python; _wilcoxon_kernel() compiles a
+# copy of the function that sees numba.prange instead.
+prange = range
+
+
+def _wilcoxon_asymptotic_impl(diffs: np.ndarray):
+    """
+    Two-sided Wilcoxon signed-rank test, normal approximation, for each column of `diffs`.
+    NaN marks a missing pair; zero differences are dropped and tied ranks averaged
+    (with tie-corrected variance), matching scipy.stats.wilcoxon for samples larger
+    than _WILCOXON_EXACT_MAX_N. Written to compile under numba.njit.
+    """
+    n_vars = diffs.shape[1]
+    stat = np.empty(n_vars)
+    pval = np.empty(n_vars)
+    for c in prange(n_vars):
+        col = diffs[:, c]
+        d = col[~np.isnan(col) & (col != 0)]
+        n = d.size
+        absd = np.abs(d)
+        order = np.argsort(absd)
+        ranks = np.empty(n)
+        tie_term = 0.0
+        i = 0
+        while i < n:
+            j = i
+            while j + 1 < n and absd[order[j + 1]] == absd[order[i]]:
+                j += 1
+            for k in range(i, j + 1):
+                ranks[order[k]] = (i + j + 2) / 2.0
+            tie_term += (j - i + 1) ** 3 - (j - i + 1)
+            i = j + 1
+        r_plus = 0.0
+        for k in range(n):
+            if d[k] > 0:
+                r_plus += ranks[k]
+        r_minus = n * (n + 1) / 2.0 - r_plus
+        se = math.sqrt((n * (n + 1) * (2 * n + 1) - tie_term / 2) / 24)
+        z = (r_plus - n * (n + 1) * 0.25) / se
+        stat[c] = min(r_plus, r_minus)
+        pval[c] = math.erfc(abs(z) / math.sqrt(2))
+    return stat, pval
+
+
+@lru_cache(maxsize=None)
+def _wilcoxon_kernel():
+    """
+    Returns _wilcoxon_asymptotic_impl compiled with Numba, or None if Numba is not
+    installed. Imported and compiled on first use, so only a run with a column of more
+    than _WILCOXON_EXACT_MAX_N pairs pays for it.
+    """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+    impl = _wilcoxon_asymptotic_impl
+    parallel_impl = types.FunctionType(impl.__code__, {**impl.__globals__, 'prange': prange},
+                                       impl.__name__, impl.__defaults__, impl.__closure__)
+    return njit(parallel=True, cache=True)(parallel_impl)
+
+
+def _paired_ttest(diffs: np.ndarray):
+    """
+    Two-sided paired t-test for each column of `diffs` (NaN marks a missing pair),
+    computed in closed form on the whole matrix. Matches scipy.stats.ttest_rel with
+    nan_policy='omit' without its per-call masking overhead.
+    """
+    n = np.count_nonzero(~np.isnan(diffs), axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(diffs, axis=0) / n
+        var = np.nansum((diffs - mean) ** 2, axis=0) / (n - 1)
+        stat = mean / np.sqrt(var / n)
+    from scipy.stats import t as t_dist
+    return stat, 2 * t_dist.sf(np.abs(stat), n - 1)
+
+
+# Below this many pairs Shapiro-Wilk has too little power to be worth consulting
+# (and under 3 it is undefined), so 'auto' goes straight to the paired t-test.
+_SHAPIRO_MIN_N = 8
+
+
+def _paired_tests(first_mat: np.ndarray, last_mat: np.ndarray, test_selection: str = 'auto') -> dict:
+    """
+    Runs the first-vs-last comparison for every variable (column) at once.
+    A participant (row) is used for a variable only if both of its means are present.
+    With test_selection 'auto', Shapiro-Wilk on the differences picks the test per
+    variable: a paired t-test if normal (p > 0.05), otherwise Wilcoxon. Variables with
+    fewer than _SHAPIRO_MIN_N pairs skip Shapiro-Wilk and use the t-test. 'ttest' or
+    'wilcoxon' forces that test for every variable. Shapiro_p is NaN wherever the check
+    was skipped. Each test is then called once, vectorized over its columns.
+    """
+    from scipy.stats import shapiro, wilcoxon
+
+    present = ~(np.isnan(first_mat) | np.isnan(last_mat))
+    a = np.where(present, first_mat, np.nan)
+    b = np.where(present, last_mat, np.nan)
+    diffs = a - b
+    n_vars = first_mat.shape[1]
+    n_pairs = present.sum(axis=0)
+
+    if test_selection == 'auto':
+        shapiro_p = np.full(n_vars, np.nan)
+        for c in np.flatnonzero(n_pairs >= _SHAPIRO_MIN_N):
+            shapiro_p[c] = shapiro(diffs[present[:, c], c])[1]
+        use_ttest = (shapiro_p > 0.05) | (n_pairs < _SHAPIRO_MIN_N)
+    else:
+        shapiro_p = np.full(n_vars, np.nan)
+        use_ttest = np.full(n_vars, test_selection == 'ttest')
+    stat = np.zeros(n_vars)
+    p = np.ones(n_vars)
+
+    t_cols = np.flatnonzero(use_ttest)
+    if t_cols.size:
+        stat[t_cols], p[t_cols] = _paired_ttest(diffs[:, t_cols])
+
+    # Wilcoxon is undefined when every difference is zero; report (0, 1) as before.
+    # NaN marks a missing pair, so only complete pairs count towards "nonzero".
+    w_cols = np.flatnonzero(~use_ttest & np.any(present & (diffs != 0), axis=0))
+    # Large samples use the normal approximation; the compiled kernel covers them in one call.
+    fast_cols = w_cols[n_pairs[w_cols] > _WILCOXON_EXACT_MAX_N]
+    wilcoxon_asymptotic = _wilcoxon_kernel() if fast_cols.size else None
+    if wilcoxon_asymptotic is not None:
+        stat[fast_cols], p[fast_cols] = wilcoxon_asymptotic(np.ascontiguousarray(diffs[:, fast_cols]))
+        w_cols = w_cols[n_pairs[w_cols] <= _WILCOXON_EXACT_MAX_N]
+    if w_cols.size:
+        stat[w_cols], p[w_cols] = wilcoxon(a[:, w_cols], b[:, w_cols], axis=0, nan_policy='omit')
+
+    return {
+        'N': n_pairs,
+        'Mean_First': _nanmean(a, axis=0), 'Mean_Last': _nanmean(b, axis=0),
+        'Shapiro_p': shapiro_p,
+        'Test': np.where(use_ttest, 'Paired t-test', 'Wilcoxon'),
+        'Test_stat': stat, 'p_value': p,
+    }
+
+
+def _failed_future(exc: BaseException) -> Future:
+    """Returns an already-completed Future that raises `exc`, for errors found before submitting."""
+    future = Future()
+    future.set_exception(exc)
+    return future
+
+
+class _InlineExecutor:
+    """Runs submitted calls immediately in this process, returning completed Futures."""
+
+    def submit(self, fn, *args) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+# Below this many participants in a condition (or on a single CPU), starting worker processes
+# costs more than it saves: a spawned worker re-imports this module and its dependencies.
+_PROCESS_POOL_MIN_PARTICIPANTS = 16
+_PROCESS_POOL = None
+_PROCESS_POOL_LOCK = threading.Lock()
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    """Returns the participant worker pool, started on first use and kept for later runs."""
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            # 'spawn' avoids forking a process that is running Tk and worker threads. The default
+            # worker count is the CPU count, capped as the platform requires (61 on Windows).
+            _PROCESS_POOL = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        return _PROCESS_POOL
+
+
+def _shutdown_process_pool():
+    """Stops the participant worker pool, if started; the next run starts a fresh one."""
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        pool, _PROCESS_POOL = _PROCESS_POOL, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+def _participant_executor(n_participants: int):
+    """Picks where a condition's participants run: in this process for small jobs, else the pool."""
+    if n_participants < _PROCESS_POOL_MIN_PARTICIPANTS or (os.cpu_count() or 1) == 1:
+        return _InlineExecutor()
+    return _process_pool()
+
+
 def run_analysis(analysis_params: dict, logger=print):
     """
     Executes the entire analysis pipeline across all participants and conditions.
     This function now acts as a router, calling the correct sub-functions based
-    on the selected analysis mode.
+    on the selected analysis mode. Large conditions are processed in a pool of worker
+    processes that is kept between runs; small ones run in this process. Logging and
+    aggregation stay in the calling process and follow the participants' name order,
+    so results do not depend on which worker finishes first.
     """
-    results = []
+    # Results are accumulated column-wise: one array per column and condition.
+    results = {col: [] for col in RESULT_COLUMNS}
     target_conditions = ['serve', 'return']
 
     # Unpack parameters from the dictionary
     mode = analysis_params['mode']
     root_dir = analysis_params['data_root']
     n_trials = analysis_params['n_trials']
-
-    for cond_dir in root_dir.iterdir():
-        if not cond_dir.is_dir() or cond_dir.name.lower() not in target_conditions:
-            if cond_dir.is_dir(): logger(f"Ignoring non-target folder: {cond_dir.name}")
+    timeline_dir = analysis_params.get('timeline_dir')  # timeline mode only
+    outcome = analysis_params.get('outcome')  # outcome mode only
+    _prune_disk_cache()
+    # Scan the timeline folder once; each participant lookup is then a dict access.
+    timeline_index = build_timeline_index(timeline_dir) if mode == 'timeline' else {}
+
+    for cond_entry in _subdirs(root_dir):
+        if cond_entry.name.lower() not in target_conditions:
+            logger(f"Ignoring non-target folder: {cond_entry.name}")
             continue
 
+        cond_dir = Path(cond_entry.path)
         condition = cond_dir.name
-        agg = {}
         logger(f"Processing Condition: {condition}...")
-        for part_dir in cond_dir.iterdir():
-            if not part_dir.is_dir(): continue
+        part_dirs = sorted(Path(entry.path) for entry in _subdirs(cond_dir))
+        executor = _participant_executor(len(part_dirs))
+        futures = {}
+        for part_dir in part_dirs:
+            # Ship only this participant's timeline entry rather than the whole index.
+            key = (part_dir.name.lower(), condition.lower())
+            own_index = {key: timeline_index[key]} if key in timeline_index else {}
+            trial_files = None
+            if mode == 'outcome':
+                # List the selected outcome folder here, so workers need not rescan it. A
+                # missing folder is passed as None so the worker reports it as before; any
+                # other listing error becomes this participant's result and is skipped below.
+                try:
+                    trial_files = _scan_outcome_dir(part_dir / outcome.lower())
+                except OSError as e:
+                    futures[_failed_future(e)] = part_dir
+                    continue
+            future = executor.submit(_participant_worker, part_dir, mode, condition, timeline_dir,
+                                     own_index, outcome, trial_files, n_trials)
+            futures[future] = part_dir
+        # One row per participant (upper bound: every submitted folder), one column per variable.
+        # Participants lacking a variable keep NaN in that cell and are left out of its test.
+        first_mat = np.full((len(futures), 0), np.nan)
+        last_mat = np.full_like(first_mat, np.nan)
+        var_index = {}
+        n_rows = 0
+        for future, part_dir in futures.items():
             try:
-                # ROUTER: Call the correct 'gather_means' function based on mode
-                if mode == 'timeline':
-                    means = gather_means_timeline(
-                        part_dir, analysis_params['timeline_dir'], condition, n_trials
-                    )
-                else:  # mode == 'outcome'
-                    means = gather_means_outcome(
-                        part_dir, condition, analysis_params['outcome'], n_trials
-                    )
-
-                for var, (m1, m2) in means.items():
-                    agg.setdefault(var, {'first': [], 'last': []})
-                    agg[var]['first'].append(m1)
-                    agg[var]['last'].append(m2)
-
-            except (FileNotFoundError, ValueError) as e:
+                means = future.result()
+            except (OSError, ValueError) as e:
                 logger(f"  - Skipping P '{part_dir.name}': {e}")
                 continue
+            except CancelledError:
+                # The pool was shut down mid-run (e.g. by clear_cache); the statistics would
+                # silently cover only some participants, so the whole run fails instead.
+                raise RuntimeError(
+                    f"Analysis interrupted: P '{part_dir.name}' was cancelled before it was processed."
+                ) from None
+            except BrokenProcessPool:
+                # A worker died and the remaining futures fail too; start a new pool next time.
+                _shutdown_process_pool()
+                raise RuntimeError(
+                    f"Analysis interrupted: a worker process stopped while processing P '{part_dir.name}'."
+                ) from None
             except Exception:
                 logger(f"  - An unexpected error occurred with P '{part_dir.name}'. Skipping.")
                 logger(traceback.format_exc())
                 continue
+            if not means.variables:
+                continue
+
+            new_vars = [var for var in means.variables if var not in var_index]
+            if new_vars:
+                for var in new_vars:
+                    var_index[var] = len(var_index)
+                pad = ((0, 0), (0, len(new_vars)))
+                first_mat = np.pad(first_mat, pad, constant_values=np.nan)
+                last_mat = np.pad(last_mat, pad, constant_values=np.nan)
+            cols = [var_index[var] for var in means.variables]
+            first_mat[n_rows, cols], last_mat[n_rows, cols] = means.first, means.last
+            n_rows += 1
 
         # Perform statistical tests on aggregated data for the condition
-        for var, data in agg.items():
-            a = np.array(data['first'])
-            b = np.array(data['last'])
-            diffs = a - b
-            mean_first, mean_last = np.mean(a), np.mean(b)
-            _, sh_p = shapiro(diffs)
-
-            if sh_p > 0.05:
-                test_name = 'Paired t-test'
-                stat, p = ttest_rel(a, b, nan_policy='omit')
-            else:
-                test_name = 'Wilcoxon'
-                stat, p = (wilcoxon(a, b) if np.any(diffs != 0) else (0, 1))
+        stats = _paired_tests(
+            first_mat[:n_rows], last_mat[:n_rows], analysis_params.get('test_selection', 'auto')
+        )
+
+        # Conditionally create the label based on the analysis mode
+        if mode == 'outcome':
+            condition_label = f"{condition} ({outcome})"
+        else:  # mode == 'timeline'
+            condition_label = condition
+
+        # _paired_tests' arrays are ordered like var_index (columns were numbered on insertion).
+        results['Condition'].append(np.full(len(var_index), condition_label, dtype=object))
+        results['Variable'].append(np.array(list(var_index), dtype=object))
+        for col, values in stats.items():
+            results[col].append(values)
+    columns = {col: np.concatenate(parts) if parts else [] for col, parts in results.items()}
+    # Every condition repeats the same variable names; keep each name once, as a category.
+    columns['Variable'] = pd.Categorical(columns['Variable'])
+    return pd.DataFrame(columns, copy=False)
 
-            # Conditionally create the label based on the analysis mode
-            if mode == 'outcome':
-                condition_label = f"{condition} ({analysis_params['outcome']})"
-            else:  # mode == 'timeline'
-                condition_label = condition
 
-            results.append({
-                'Condition': condition_label,
-                'Variable': var, 'N': len(a), 'Mean_First': mean_first, 'Mean_Last': mean_last,
-                'Shapiro_p': sh_p, 'Test': test_name, 'Test_stat': stat, 'p_value': p
-            })
-    return pd.DataFrame(results)
+# ---[ 4.5 Result Export ]---
+
+def _excel_cell(value):
+    """Converts a result value for xlsxwriter, writing NaN as a blank cell and infinities as text (like pandas)."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return None if math.isnan(value) else ('inf' if value > 0 else '-inf')
+    return value
+
+
+def _column_width(values: pd.Series, header: str) -> int:
+    """Width for a result column: its longest str()-rendered entry or header, plus padding."""
+    # Repeated entries (conditions, variables, test names) are measured once.
+    longest = max(map(len, map(str, pd.unique(values.to_numpy()).tolist())), default=0)
+    return max(longest, len(header)) + 4
+
+
+def export_results_to_excel(results_df: pd.DataFrame, filepath: str):
+    """
+    Writes the results table to a formatted .xlsx file.
+    The table has one row per condition and variable, so the workbook is assembled in
+    memory (xlsxwriter's in_memory mode) instead of through temporary files; rows are
+    written directly rather than through pandas' to_excel.
+    """
+    widths = [_column_width(results_df[col], str(col)) for col in results_df.columns]
+    workbook = xlsxwriter.Workbook(filepath, {'in_memory': True, 'strings_to_numbers': False})
+    try:
+        worksheet = workbook.add_worksheet('Analysis_Results')
+        center_format = workbook.add_format({'align': 'center', 'valign': 'vcenter'})
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        for i, width in enumerate(widths):
+            worksheet.set_column(i, i, width, center_format)
+        worksheet.write_row(0, 0, [str(col) for col in results_df.columns], header_format)
+        for row_num, row in enumerate(results_df.itertuples(index=False, name=None), start=1):
+            worksheet.write_row(row_num, 0, [_excel_cell(value) for value in row])
+    finally:
+        workbook.close()
 
 
 # =============================================================================
 # SECTION 5: GUI APPLICATION
 # =============================================================================
+# GUI labels for the 'test_selection' analysis parameter.
+TEST_SELECTION_OPTIONS = {
+    "Auto-select test": 'auto',
+    "Force t-test": 'ttest',
+    "Force Wilcoxon": 'wilcoxon',
+}
+
+
 class TrialAnalyzerApp(ctk.CTk):
     """The main application window for the Trial Analyzer."""
 
@@ -320,15 +1069,22 @@ class TrialAnalyzerApp(ctk.CTk):
         self.data_root_var = ctk.StringVar(value=default_paths['data_root'])
         self.timeline_dir_var = ctk.StringVar(value=default_paths['timeline_dir'])
         self.analysis_mode_var = ctk.StringVar(value="timeline")
+        self._last_mode = None  # mode the widgets are currently laid out for
         self.outcome_var = ctk.StringVar(value="Win")
         self.n_var = ctk.IntVar(value=10)
+        self.test_selection_var = ctk.StringVar(value="Auto-select test")
         self.results_df = None
+        # Log lines from the analysis thread; only the Tk main loop touches the textbox.
+        self._log_queue = queue.Queue()
 
         # --- Build Menu Bar ---
         menu = tkinter.Menu(self)
-        file_menu = tkinter.Menu(menu, tearoff=0)
-        file_menu.add_command(label="Exit", command=self.quit)
-        menu.add_cascade(label="File", menu=file_menu)
+        self.file_menu = tkinter.Menu(menu, tearoff=0)
+        # Disabled while an analysis runs: clearing shuts down the worker pool it is using.
+        self.file_menu.add_command(label="Clear Cache", command=self.clear_cache)
+        self.file_menu.add_separator()
+        self.file_menu.add_command(label="Exit", command=self.quit)
+        menu.add_cascade(label="File", menu=self.file_menu)
         self.config(menu=menu)
 
         # --- Build Input Frame ---
@@ -372,6 +1128,9 @@ class TrialAnalyzerApp(ctk.CTk):
         ctk.CTkLabel(self.input_frame, text="Trials (first/last N):").grid(row=3, column=0, sticky="w", padx=5, pady=5)
         ctk.CTkEntry(self.input_frame, textvariable=self.n_var, width=80).grid(row=3, column=1, sticky="w", padx=5,
                                                                                pady=5)
+        ctk.CTkLabel(self.input_frame, text="Statistical Test:").grid(row=4, column=0, sticky="w", padx=5, pady=5)
+        ctk.CTkOptionMenu(self.input_frame, variable=self.test_selection_var,
+                          values=list(TEST_SELECTION_OPTIONS)).grid(row=4, column=1, sticky="w", padx=5, pady=5)
 
         # --- Build Action Buttons Frame ---
         btn_frame = ctk.CTkFrame(self)
@@ -387,10 +1146,14 @@ class TrialAnalyzerApp(ctk.CTk):
 
         # Set initial GUI state
         self.toggle_mode()
+        self._drain_log_queue()
 
     def toggle_mode(self):
         """Shows/hides GUI elements based on the selected analysis mode."""
         mode = self.analysis_mode_var.get()
+        if mode == self._last_mode:
+            return  # re-clicked the active mode; the layout is already right
+        self._last_mode = mode
         if mode == "timeline":
             # Show timeline widgets
             self.timeline_label.grid()
@@ -409,8 +1172,38 @@ class TrialAnalyzerApp(ctk.CTk):
             self.outcome_dropdown.grid(row=2, column=1, sticky="w", padx=5, pady=5)
 
     def _log(self, message: str):
-        self.log_box.insert("end", message + "\n")
-        self.log_box.see("end")
+        """Queues a log line for the textbox; safe to call from the analysis thread."""
+        self._log_queue.put(message)
+
+    def _call_in_ui(self, func, *args, **kwargs):
+        """Queues a widget call to run on the Tk thread, in order with the queued log lines."""
+        self._log_queue.put((func, args, kwargs))
+
+    def _drain_log_queue(self):
+        """Writes queued log lines to the textbox in batches and runs queued widget calls, then reschedules itself."""
+        lines = []
+
+        def flush():
+            if lines:
+                self.log_box.insert("end", "\n".join(lines) + "\n")
+                self.log_box.see("end")
+                lines.clear()
+
+        try:
+            for _ in range(200):
+                item = self._log_queue.get_nowait()
+                if isinstance(item, str):
+                    lines.append(item)
+                else:
+                    flush()
+                    func, args, kwargs = item
+                    func(*args, **kwargs)
+        except queue.Empty:
+            pass
+        finally:
+            # Even if a queued call raised, keep the lines already taken and keep draining.
+            flush()
+            self.after(100, self._drain_log_queue)
 
     def browse_data_folder(self):
         path = filedialog.askdirectory(title="Select Trial Data Root Folder")
@@ -428,9 +1221,14 @@ class TrialAnalyzerApp(ctk.CTk):
         save_default_paths(data_path, timeline_path)
         messagebox.showinfo("Saved", "Default paths have been set.")
 
+    def clear_cache(self):
+        clear_cache()
+        messagebox.showinfo("Cache Cleared", "Cached trial and timeline data has been deleted.")
+
     def start_analysis(self):
         """Initiates the analysis process in a background thread."""
         self.run_btn.configure(state="disabled")
+        self.file_menu.entryconfigure("Clear Cache", state="disabled")
         self.export_btn.configure(state="disabled")
         self.log_box.delete("1.0", "end")
         self.results_df = None
@@ -441,7 +1239,8 @@ class TrialAnalyzerApp(ctk.CTk):
             'data_root': Path(self.data_root_var.get()),
             'n_trials': self.n_var.get(),
             'timeline_dir': Path(self.timeline_dir_var.get()),
-            'outcome': self.outcome_var.get()
+            'outcome': self.outcome_var.get(),
+            'test_selection': TEST_SELECTION_OPTIONS[self.test_selection_var.get()]
         }
 
         threading.Thread(target=self._run_analysis_thread, args=(params,), daemon=True).start()
@@ -478,12 +1277,13 @@ class TrialAnalyzerApp(ctk.CTk):
                         means_line = (f"  (First {params['n_trials']} Avg: {row.Mean_First:.3f}, "
                                       f"Last {params['n_trials']} Avg: {row.Mean_Last:.3f})")
                         self._log(f"\n{summary}\n{results_line}\n{means_line}")
-                self.export_btn.configure(state="normal")
+                self._call_in_ui(self.export_btn.configure, state="normal")
         except Exception:
             self._log("\nAn critical error occurred during analysis.")
             self._log(traceback.format_exc())
         finally:
-            self.run_btn.configure(state="normal")
+            self._call_in_ui(self.run_btn.configure, state="normal")
+            self._call_in_ui(self.file_menu.entryconfigure, "Clear Cache", state="normal")
 
     def export(self):
         """Exports the analysis results DataFrame to a formatted Excel file."""
@@ -497,13 +1297,7 @@ class TrialAnalyzerApp(ctk.CTk):
         )
         if not filepath: return
         try:
-            with pd.ExcelWriter(filepath, engine='xlsxwriter') as writer:
-                self.results_df.to_excel(writer, sheet_name='Analysis_Results', index=False)
-                workbook, worksheet = writer.book, writer.sheets['Analysis_Results']
-                center_format = workbook.add_format({'align': 'center', 'valign': 'vcenter'})
-                for i, col in enumerate(self.results_df.columns):
-                    col_len = max(self.results_df[col].astype(str).map(len).max(), len(col))
-                    worksheet.set_column(i, i, col_len + 4, center_format)
+            export_results_to_excel(self.results_df, filepath)
             messagebox.showinfo("Success", f"Results successfully exported to\n{filepath}")
         except Exception as e:
             messagebox.showerror("Export Error", f"Could not save file.\nError: {e}")
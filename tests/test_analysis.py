@@ -1,24 +1,60 @@
+import importlib.util
+import math
 import sys
 import types
 from pathlib import Path
 import pytest
 
+class _Dummy:
+    def __init__(self, *a, **k):
+        pass
+
+
 class DummyModule(types.ModuleType):
     def __getattr__(self, name):
-        class _Dummy:
-            def __init__(self, *a, **k):
-                pass
+        # Cache on the module so later lookups of the same name skip __getattr__.
+        setattr(self, name, _Dummy)
         return _Dummy
 
 # Provide dummy modules for optional dependencies to avoid pip installs
-for mod in ["customtkinter", "openpyxl", "xlsxwriter", "xlsxwriteropenpyxl"]:
-    if mod not in sys.modules:
+for mod in ["customtkinter", "openpyxl", "xlsxwriter"]:
+    if mod not in sys.modules and importlib.util.find_spec(mod) is None:
         sys.modules[mod] = DummyModule(mod)
 
 # Ensure the src directory is on the Python path
 sys.path.append(str(Path(__file__).resolve().parents[1] / 'src'))
 
-from LearningEffectAnalysis import extract_trial_number, gather_means_outcome
+import LearningEffectAnalysis
+from LearningEffectAnalysis import extract_trial_number, gather_means_outcome, load_series_from_file, load_timeline
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keeps the on-disk parse cache out of the user's home directory."""
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setattr(LearningEffectAnalysis, "CACHE_DIR", cache_dir)
+    LearningEffectAnalysis.clear_cache()
+    return cache_dir
+
+
+def write_trial(path, rows):
+    """Writes a Variable/Value trial workbook."""
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    wb.active.append(["Variable", "Value"])
+    for row in rows:
+        wb.active.append(list(row))
+    wb.save(path)
+
+
+def write_timeline(path, events):
+    """Writes a timeline workbook of (event type, trial number) rows."""
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    wb.active.append(["Event Type", "Trial Number"])
+    for row in events:
+        wb.active.append(list(row))
+    wb.save(path)
 
 
 @pytest.mark.parametrize(
@@ -27,6 +63,7 @@ from LearningEffectAnalysis import extract_trial_number, gather_means_outcome
         ("P1_serve_win1.xls", 1),
         ("P2_return_L10.xlsx", 10),
         ("trial07.xlsm", 7),
+        ("P3_serve_loss4.csv", 4),
         ("random_file.txt", -1),
     ],
 )
@@ -34,6 +71,18 @@ def test_extract_trial_number_parsing(filename, expected):
     assert extract_trial_number(Path(filename)) == expected
 
 
+def test_extract_trial_numbers_batch():
+    paths = [Path("P1_Serve_loss3.xlsx"), Path("notes.txt"), Path("P1_Serve_w12.csv")]
+    assert LearningEffectAnalysis.extract_trial_numbers(paths).tolist() == [3, -1, 12]
+
+
+def test_subdirs_skips_hidden_directories(tmp_path):
+    (tmp_path / "P1").mkdir()
+    (tmp_path / ".hidden").mkdir()
+    (tmp_path / "notes.txt").touch()
+    assert [entry.name for entry in LearningEffectAnalysis._subdirs(tmp_path)] == ["P1"]
+
+
 def test_gather_means_outcome_missing_dir(tmp_path):
     part_dir = tmp_path / "P1"
     part_dir.mkdir()
@@ -57,3 +106,310 @@ def test_gather_means_outcome_insufficient_files(tmp_path):
         (outcome_dir / f"P1_Serve_win{i+1}.xls").touch()
     with pytest.raises(ValueError):
         gather_means_outcome(part_dir, "Serve", "Win", 2)
+
+
+def test_load_series_from_file_xlsx(tmp_path, isolated_cache):
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    wb.active.append([" Variable ", "Value"])
+    wb.active.append(["Speed", 1.5])
+    wb.active.append(["Spin", 3])
+    path = tmp_path / "P1_Serve_win1.xlsx"
+    wb.save(path)
+    series = load_series_from_file(path)
+    assert series.to_dict() == {"Speed": 1.5, "Spin": 3}
+    assert load_series_from_file(path) is series
+
+    # A fresh process (empty in-memory cache) is served from the disk cache.
+    LearningEffectAnalysis._load_series_cached.cache_clear()
+    LearningEffectAnalysis._load_trial_cached.cache_clear()
+    assert any(isolated_cache.iterdir())
+    assert load_series_from_file(path).to_dict() == series.to_dict()
+
+    LearningEffectAnalysis.clear_cache()
+    assert not isolated_cache.exists()
+    assert not LearningEffectAnalysis._VARIABLE_LAYOUTS
+
+
+def test_disk_cache_versioning_and_pruning(tmp_path, isolated_cache, monkeypatch):
+    import os
+    path = tmp_path / "P1_Serve_win1.xlsx"
+    write_trial(path, [("Speed", 1.5)])
+    LearningEffectAnalysis.load_trial_from_file(path)
+    version_dir = isolated_cache / f"v{LearningEffectAnalysis._CACHE_VERSION}"
+    (entry,) = version_dir.iterdir()
+
+    # An edited file overwrites its own entry instead of adding one.
+    write_trial(path, [("Speed", 2.5)])
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+    LearningEffectAnalysis._load_trial_cached.cache_clear()
+    assert LearningEffectAnalysis.load_trial_from_file(path)[1].tolist() == [2.5]
+    assert list(version_dir.iterdir()) == [entry]
+
+    # Other versions' entries go; then the oldest entries, down to the size cap.
+    (isolated_cache / "v1").mkdir()
+    (isolated_cache / "v1" / "old.pkl").write_bytes(b"x")
+    (isolated_cache / "legacy.pkl").write_bytes(b"x")
+    old = version_dir / "old.pkl"
+    old.write_bytes(b"x" * 100)
+    os.utime(old, ns=(0, 0))
+    monkeypatch.setattr(LearningEffectAnalysis, "_MAX_CACHE_BYTES", entry.stat().st_size)
+    LearningEffectAnalysis._prune_disk_cache()
+    assert list(isolated_cache.iterdir()) == [version_dir]
+    assert list(version_dir.iterdir()) == [entry]
+
+
+def test_load_trial_from_file_replaced_with_same_mtime(tmp_path):
+    # e.g. `cp -p` or `rsync -t`: new contents, old modification time.
+    import os
+    path = tmp_path / "P1_Serve_win1.xlsx"
+    write_trial(path, [("Speed", 1.5)])
+    mtime_ns = path.stat().st_mtime_ns
+    assert LearningEffectAnalysis.load_trial_from_file(path)[1].tolist() == [1.5]
+    write_trial(path, [("Speed", 2.5), ("Spin", 3)])
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    assert LearningEffectAnalysis.load_trial_from_file(path)[1].tolist() == [2.5, 3.0]
+
+
+def test_load_trial_from_file_without_sheet_dimension(tmp_path):
+    # Without <dimension>, openpyxl's read-only rows end at their last non-blank cell.
+    import re
+    import zipfile
+    src, path = tmp_path / "written.xlsx", tmp_path / "P1_Serve_win1.xlsx"
+    write_trial(src, [("Speed", 1.5), ("Spin", None)])
+    with zipfile.ZipFile(src) as zin, zipfile.ZipFile(path, "w") as zout:
+        for item in zin.infolist():
+            data = zin.read(item)
+            if item.filename.startswith("xl/worksheets/"):
+                data = re.sub(rb"<dimension[^>]*/>", b"", data)
+            zout.writestr(item, data)
+    variables, values = LearningEffectAnalysis.load_trial_from_file(path)
+    assert variables == ("Speed", "Spin")
+    assert values[0] == 1.5 and math.isnan(values[1])
+
+
+def test_gather_means_outcome_means(tmp_path):
+    outcome_dir = tmp_path / "P1" / "win"
+    outcome_dir.mkdir(parents=True)
+    for i in range(1, 5):
+        write_trial(outcome_dir / f"P1_Serve_win{i}.xlsx", [("A", i), ("B", None if i == 1 else 10 * i)])
+    means = gather_means_outcome(tmp_path / "P1", "Serve", "Win", 2)
+    assert means.variables == ("A", "B")
+    assert means.first.tolist() == [1.5, 20.0]
+    assert means["A"] == (1.5, 3.5)
+    assert means["A"].last == 3.5
+    assert means.as_dict()["B"] == (20.0, 35.0)
+    with pytest.raises(KeyError):
+        means["missing"]
+    assert "A" in means and "missing" not in means
+    assert means.keys() == ("A", "B")
+    assert dict(means.items()) == {"A": (1.5, 3.5), "B": (20.0, 35.0)}
+
+
+def test_gather_means_outcome_mixed_layouts(tmp_path):
+    outcome_dir = tmp_path / "P1" / "win"
+    outcome_dir.mkdir(parents=True)
+    write_trial(outcome_dir / "P1_Serve_win1.xlsx", [("A", 1), ("B", 2)])
+    write_trial(outcome_dir / "P1_Serve_win2.xlsx", [("B", 4), ("C", 6)])
+    write_trial(outcome_dir / "P1_Serve_win3.xlsx", [("A", 5)])
+    write_trial(outcome_dir / "P1_Serve_win4.xlsx", [("C", 9), ("A", 7)])
+    means = gather_means_outcome(tmp_path / "P1", "Serve", "Win", 2)
+    assert means["A"] == (1.0, 6.0)
+    assert means["B"][0] == 3.0 and math.isnan(means["B"][1])  # B is absent from the last block
+    assert means["C"] == (6.0, 9.0)
+
+
+def test_gather_means_outcome_csv(tmp_path):
+    outcome_dir = tmp_path / "P1" / "win"
+    outcome_dir.mkdir(parents=True)
+    for i in range(1, 5):
+        # Byte-order mark, an empty field, a blank line and a short row.
+        (outcome_dir / f"P1_Serve_win{i}.csv").write_text(f"\ufeffVariable,Value\nA,{i}\nB,\n\nC\n", encoding="utf-8")
+    means = gather_means_outcome(tmp_path / "P1", "Serve", "Win", 2)
+    assert means["A"] == (1.5, 3.5)
+    assert all(math.isnan(m) for m in means["B"] + means["C"])
+
+
+def test_first_last_files_matches_full_sort_with_ties():
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        m = int(rng.integers(4, 30))
+        n = int(rng.integers(1, m // 2 + 1))
+        nums = rng.integers(0, 8, size=m)  # few distinct numbers, so most cut-offs are ties
+        paths = [Path(f"f{int(rng.integers(0, 50)):02d}_{i}.xlsx") for i in range(m)]
+        ordered = [f for _, f in sorted(zip(nums.tolist(), paths))]
+        first, last = LearningEffectAnalysis._first_last_files(nums, paths, n)
+        assert first == ordered[:n]
+        assert last == ordered[-n:]
+
+
+def test_load_timeline_event_ids(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    timeline_dir = tmp_path / "timelines"
+    timeline_dir.mkdir()
+    wb = openpyxl.Workbook()
+    for row in [["Event Type", "Trial Number"], [" WIN ", 1], ["Loss", 1], [None, None], ["win", 2]]:
+        wb.active.append(row)
+    wb.save(timeline_dir / "P1_Serve_timeline.xlsx")
+    assert load_timeline(tmp_path / "P1", timeline_dir, "Serve") == ["win1", "loss1", "win2"]
+
+
+def test_gather_means_timeline_file_naming(tmp_path):
+    part_dir = tmp_path / "P1"
+    (part_dir / "win").mkdir(parents=True)
+    (part_dir / "loss").mkdir()
+    timeline_dir = tmp_path / "timelines"
+    timeline_dir.mkdir()
+    write_timeline(timeline_dir / "P1_Serve_timeline.xlsx", [("Win", 1), ("Loss", 1), ("Win", 2), ("Loss", 2)])
+    write_trial(part_dir / "win" / "P1_Serve_win1.xlsx", [("A", 1)])
+    write_trial(part_dir / "loss" / "P1_Serve_l1.xlsx", [("A", 3)])  # abbreviated outcome
+    write_trial(part_dir / "win" / "P1_Serve_w2.xlsx", [("A", 5)])
+    # Both names match 'loss2'; whichever the folder lists first is used.
+    write_trial(part_dir / "loss" / "P1_Serve_loss2.xlsx", [("A", 7)])
+    write_trial(part_dir / "loss" / "P1_Serve_l2.xlsx", [("A", 11)])
+    listed = [f.name for f in LearningEffectAnalysis.list_data_files(part_dir / "loss")]
+    loss2 = 7 if listed.index("P1_Serve_loss2.xlsx") < listed.index("P1_Serve_l2.xlsx") else 11
+
+    means = LearningEffectAnalysis.gather_means_timeline(part_dir, timeline_dir, "Serve", 2)
+    assert means["A"] == (2.0, (5 + loss2) / 2)
+
+
+def test_load_trial_from_id_rejects_malformed_ids(tmp_path):
+    (tmp_path / "P1" / "win").mkdir(parents=True)
+    for trial_id in ["win1.0", "1win", "win"]:
+        with pytest.raises(ValueError):
+            LearningEffectAnalysis.load_trial_from_id(tmp_path / "P1", "Serve", trial_id)
+
+
+def test_wilcoxon_asymptotic_matches_scipy():
+    np = pytest.importorskip("numpy")
+    from scipy.stats import wilcoxon
+    rng = np.random.default_rng(0)
+    diffs = np.round(rng.normal(0.3, 1, size=(60, 3)), 1)  # rounding produces ties and zeros
+    diffs[5, 1] = np.nan
+    stat, p = LearningEffectAnalysis._wilcoxon_asymptotic_impl(diffs)
+    for c in range(diffs.shape[1]):
+        col = diffs[:, c]
+        expected = wilcoxon(col[~np.isnan(col)])
+        assert stat[c] == pytest.approx(expected.statistic)
+        assert p[c] == pytest.approx(expected.pvalue)
+
+
+def test_paired_ttest_matches_scipy():
+    np = pytest.importorskip("numpy")
+    from scipy.stats import ttest_rel
+    rng = np.random.default_rng(1)
+    a = rng.normal(size=(12, 3))
+    b = a + rng.normal(0.2, 1, size=(12, 3))
+    a[3, 2] = np.nan
+    stat, p = LearningEffectAnalysis._paired_ttest(a - b)
+    expected = ttest_rel(a, b, axis=0, nan_policy="omit")
+    assert stat == pytest.approx(expected.statistic)
+    assert p == pytest.approx(expected.pvalue)
+
+
+def test_paired_tests_small_samples_skip_shapiro():
+    np = pytest.importorskip("numpy")
+    rng = np.random.default_rng(2)
+    first = rng.normal(size=(10, 2))
+    last = first + rng.normal(0.5, 1, size=(10, 2))
+    first[:4, 1] = np.nan  # only 6 complete pairs in the second variable
+    res = LearningEffectAnalysis._paired_tests(first, last)
+    assert res["N"].tolist() == [10, 6]
+    assert not np.isnan(res["Shapiro_p"][0])
+    assert np.isnan(res["Shapiro_p"][1])
+    assert res["Test"][1] == "Paired t-test"
+
+
+@pytest.mark.parametrize("n_participants", [10, 60])  # scipy path and asymptotic kernel path
+def test_paired_tests_all_zero_differences_with_missing_pair(n_participants):
+    np = pytest.importorskip("numpy")
+    first = np.arange(n_participants, dtype=float).reshape(-1, 1)
+    last = first.copy()
+    first[0, 0] = np.nan  # one participant lacks the variable
+    res = LearningEffectAnalysis._paired_tests(first, last, "wilcoxon")
+    assert res["N"].tolist() == [n_participants - 1]
+    assert res["Test_stat"].tolist() == [0.0]
+    assert res["p_value"].tolist() == [1.0]
+
+
+@pytest.mark.parametrize("mode", ["outcome", "timeline"])
+def test_run_analysis_end_to_end(tmp_path, monkeypatch, mode):
+    pd = pytest.importorskip("pandas")
+    data_root, timeline_dir = tmp_path / "data", tmp_path / "timelines"
+    timeline_dir.mkdir()
+    (data_root / "Other").mkdir(parents=True)
+    # Trial i of participant k has A = i*k and B = i*i*k; P3 in Serve lacks B.
+    for condition, participants in {"Serve": [1, 2, 3], "Return": [1, 2, 5]}.items():
+        for k in participants:
+            win_dir = data_root / condition / f"P{k}" / "win"
+            win_dir.mkdir(parents=True)
+            for i in range(1, 5):
+                rows = [("A", i * k)] if (condition, k) == ("Serve", 3) else [("A", i * k), ("B", i * i * k)]
+                write_trial(win_dir / f"P{k}_{condition}_win{i}.xlsx", rows)
+            if k != 5:
+                write_timeline(timeline_dir / f"P{k}_{condition}_timeline.xlsx", [("Win", i) for i in range(1, 5)])
+    (data_root / "Serve" / "P4").mkdir()  # no win folder and no timeline: skipped in both modes
+    # P5 has no timeline, and in outcome mode its folder cannot be listed.
+    scan = LearningEffectAnalysis._scan_outcome_dir
+
+    def scan_or_deny(outcome_dir):
+        if outcome_dir.parent.name == "P5":
+            raise PermissionError("denied")
+        return scan(outcome_dir)
+
+    monkeypatch.setattr(LearningEffectAnalysis, "_scan_outcome_dir", scan_or_deny)
+
+    log = []
+    df = LearningEffectAnalysis.run_analysis(
+        {"mode": mode, "data_root": data_root, "n_trials": 2, "timeline_dir": timeline_dir, "outcome": "Win"},
+        logger=log.append,
+    )
+    assert list(df.columns) == LearningEffectAnalysis.RESULT_COLUMNS
+    assert isinstance(df["Variable"].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_integer_dtype(df["N"])
+    for col in ["Mean_First", "Mean_Last", "Shapiro_p", "Test_stat", "p_value"]:
+        assert df[col].dtype == "float64"
+    suffix = " (Win)" if mode == "outcome" else ""
+    # Conditions follow the folder listing; within one, variables are in first-seen order.
+    assert sorted(df["Condition"].unique()) == [f"Return{suffix}", f"Serve{suffix}"]
+    serve = df[df["Condition"] == f"Serve{suffix}"]
+    assert serve["Variable"].tolist() == ["A", "B"]
+    assert serve["N"].tolist() == [3, 2]
+    assert serve["Mean_First"].tolist() == [3.0, 3.75]
+    assert serve["Mean_Last"].tolist() == [7.0, 18.75]
+    ret = df[df["Condition"] == f"Return{suffix}"]
+    assert ret["Variable"].tolist() == ["A", "B"]
+    assert ret["N"].tolist() == [2, 2]
+    skipped = sorted(line.split("'")[1] for line in log if "Skipping P" in line)
+    assert skipped == ["P4", "P5"]
+    assert "Ignoring non-target folder: Other" in log
+
+
+def test_run_analysis_fails_when_a_participant_is_cancelled(tmp_path, monkeypatch):
+    from concurrent.futures import Future
+    (tmp_path / "Serve" / "P1").mkdir(parents=True)
+
+    class CancellingExecutor:
+        def submit(self, fn, *args):
+            future = Future()
+            future.cancel()  # as pool.shutdown(cancel_futures=True) leaves pending work
+            return future
+
+    monkeypatch.setattr(LearningEffectAnalysis, "_participant_executor", lambda n: CancellingExecutor())
+    params = {"mode": "outcome", "data_root": tmp_path, "n_trials": 2, "outcome": "Win"}
+    with pytest.raises(RuntimeError, match="P1"):
+        LearningEffectAnalysis.run_analysis(params, logger=lambda message: None)
+
+
+def test_export_results_to_excel_roundtrip(tmp_path):
+    pytest.importorskip("xlsxwriter")
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({"Variable": ["A", "B"], "N": [3, 3], "Shapiro_p": [0.5, float("nan")]})
+    path = tmp_path / "results.xlsx"
+    LearningEffectAnalysis.export_results_to_excel(df, str(path))
+    back = pd.read_excel(path)
+    assert back["Variable"].tolist() == ["A", "B"]
+    assert back["N"].tolist() == [3, 3]
+    assert back["Shapiro_p"].isna().tolist() == [False, True]